@@ -5,8 +5,13 @@ Monitora mudanças e sincroniza em tempo real
 """
 
 import os
+import re
 import shutil
+import signal
+import stat
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 from watchdog.observers import Observer
@@ -38,18 +43,44 @@ IGNORE_PATTERNS = [
     "*.lock"
 ]
 
+# Os padrões são testados como substring do caminho; uma única regex
+# com todas as alternativas faz a verificação em uma só passada
+IGNORE_RE = re.compile("|".join(re.escape(pattern.replace("*", "")) for pattern in IGNORE_PATTERNS))
+
+# Prefixos pré-calculados para o despacho de eventos
+SOURCE_PREFIX = os.path.join(SOURCE_DIR, "")
+SYNC_PREFIXES = tuple(SYNC_ITEMS)
+
+# Máximo de itens sincronizados ao mesmo tempo na carga inicial
+INITIAL_SYNC_WORKERS = 4
+
+# Janela para agrupar rajadas de eventos do mesmo arquivo (segundos)
+DEBOUNCE_SECONDS = 0.5
+
+def relative_path(path):
+    """Caminho relativo ao SOURCE_DIR, sem normalizar eventos já absolutos"""
+    if path.startswith(SOURCE_PREFIX):
+        return path[len(SOURCE_PREFIX):]
+    return os.path.relpath(path, SOURCE_DIR)
+
 class SyncHandler(FileSystemEventHandler):
     """Handler para eventos de mudança no sistema de arquivos"""
     
     def __init__(self):
         self.last_sync = {}
+        # Caminho -> instante (monotônico) em que a espera termina
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.stopping = False
+        # Um único worker faz as cópias agendadas: uma rajada de eventos não
+        # cria uma thread por arquivo
+        self.worker = threading.Thread(target=self._debounce_loop, name="sync-debounce")
+        self.worker.start()
         
     def should_ignore(self, path):
         """Verifica se o arquivo deve ser ignorado"""
-        for pattern in IGNORE_PATTERNS:
-            if pattern.replace("*", "") in path:
-                return True
-        return False
+        return IGNORE_RE.search(path) is not None
     
     def sync_file(self, src_path):
         """Sincroniza um arquivo específico"""
@@ -57,37 +88,92 @@ class SyncHandler(FileSystemEventHandler):
             return
             
         # Calcular caminho relativo
-        rel_path = os.path.relpath(src_path, SOURCE_DIR)
+        rel_path = relative_path(src_path)
         
         # Verificar se está em uma pasta que queremos sincronizar
-        for item in SYNC_ITEMS:
-            if rel_path.startswith(item):
-                dest_path = os.path.join(DEST_DIR, rel_path)
-                
-                # Criar diretório se necessário
-                dest_dir = os.path.dirname(dest_path)
-                os.makedirs(dest_dir, exist_ok=True)
-                
-                # Copiar arquivo
-                try:
-                    if os.path.isfile(src_path):
-                        shutil.copy2(src_path, dest_path)
-                        print(f"✅ Sincronizado: {rel_path}")
-                except Exception as e:
-                    print(f"❌ Erro ao sincronizar {rel_path}: {e}")
+        if not rel_path.startswith(SYNC_PREFIXES):
+            return
+        
+        # (mtime, tamanho) identifica a versão do arquivo sem lê-lo;
+        # eventos repetidos de um arquivo inalterado não geram cópia
+        try:
+            st = os.stat(src_path)
+        except OSError:
+            return
+        if not stat.S_ISREG(st.st_mode):
+            return
+        signature = (st.st_mtime_ns, st.st_size)
+        if self.last_sync.get(rel_path) == signature:
+            return
+        
+        dest_path = os.path.join(DEST_DIR, rel_path)
+        
+        # Criar diretório se necessário
+        dest_dir = os.path.dirname(dest_path)
+        os.makedirs(dest_dir, exist_ok=True)
+        
+        # Copiar arquivo
+        try:
+            shutil.copy2(src_path, dest_path)
+            self.last_sync[rel_path] = signature
+            print(f"✅ Sincronizado: {rel_path}")
+        except Exception as e:
+            print(f"❌ Erro ao sincronizar {rel_path}: {e}")
+                    
+    def schedule_sync(self, src_path):
+        """Agenda a sincronização, reiniciando a espera a cada novo evento"""
+        if self.should_ignore(src_path):
+            return
+        
+        with self.lock:
+            # Com outros caminhos pendentes o worker já acorda antes deste prazo
+            if not self.pending:
+                self.wakeup.notify()
+            self.pending[src_path] = time.monotonic() + DEBOUNCE_SECONDS
+    
+    def _debounce_loop(self):
+        """Copia os caminhos que ficaram DEBOUNCE_SECONDS sem novos eventos"""
+        while True:
+            with self.lock:
+                while True:
+                    if self.stopping:
+                        return
+                    now = time.monotonic()
+                    due = [path for path, deadline in self.pending.items() if deadline <= now]
+                    if due:
+                        break
+                    timeout = min(self.pending.values()) - now if self.pending else None
+                    self.wakeup.wait(timeout)
+                for path in due:
+                    del self.pending[path]
+            for path in due:
+                self.sync_file(path)
+    
+    def flush_pending(self):
+        """Para o worker, esperando a cópia em andamento, e sincroniza o resto"""
+        with self.lock:
+            self.stopping = True
+            self.wakeup.notify()
+        self.worker.join()
+        
+        pending = list(self.pending)
+        self.pending.clear()
+        for src_path in pending:
+            self.sync_file(src_path)
                     
     def on_modified(self, event):
         if not event.is_directory:
-            self.sync_file(event.src_path)
+            self.schedule_sync(event.src_path)
             
     def on_created(self, event):
         if not event.is_directory:
-            self.sync_file(event.src_path)
+            self.schedule_sync(event.src_path)
             
     def on_deleted(self, event):
         if not event.is_directory and not self.should_ignore(event.src_path):
-            rel_path = os.path.relpath(event.src_path, SOURCE_DIR)
+            rel_path = relative_path(event.src_path)
             dest_path = os.path.join(DEST_DIR, rel_path)
+            self.last_sync.pop(rel_path, None)
             
             try:
                 if os.path.exists(dest_path):
@@ -96,6 +182,38 @@ class SyncHandler(FileSystemEventHandler):
             except Exception as e:
                 print(f"❌ Erro ao remover {rel_path}: {e}")
 
+def sync_item(item):
+    """Sincroniza por completo um item de SYNC_ITEMS"""
+    src = os.path.join(SOURCE_DIR, item)
+    if not os.path.exists(src):
+        return
+    
+    dest = os.path.join(DEST_DIR, item)
+    
+    try:
+        if os.path.isfile(src):
+            shutil.copy2(src, dest)
+            print(f"✅ {item} sincronizado")
+        else:
+            # Usar rsync para diretórios. Vários itens rodam ao mesmo tempo,
+            # então a saída é capturada e vira uma linha de resumo por item
+            cmd = [
+                "rsync", "-a", "--delete", "--out-format=%n",
+                "--exclude=*.log",
+                "--exclude=*.pid",
+                "--exclude=node_modules/",
+                "--exclude=__pycache__/",
+                "--exclude=.DS_Store",
+                src + "/", dest + "/"
+            ]
+            result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+            changes = len(result.stdout.splitlines())
+            print(f"✅ {item} sincronizado ({changes} alterações)")
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Erro ao sincronizar {item}: {e.stderr.strip() or e}")
+    except Exception as e:
+        print(f"❌ Erro ao sincronizar {item}: {e}")
+
 def initial_sync():
     """Faz a sincronização inicial completa"""
     print("🔄 Iniciando sincronização completa...")
@@ -103,31 +221,9 @@ def initial_sync():
     # Criar diretório de destino
     os.makedirs(DEST_DIR, exist_ok=True)
     
-    # Sincronizar cada item
-    for item in SYNC_ITEMS:
-        src = os.path.join(SOURCE_DIR, item)
-        if os.path.exists(src):
-            dest = os.path.join(DEST_DIR, item)
-            
-            try:
-                if os.path.isfile(src):
-                    shutil.copy2(src, dest)
-                else:
-                    # Usar rsync para diretórios
-                    cmd = [
-                        "rsync", "-av", "--delete",
-                        "--exclude=*.log",
-                        "--exclude=*.pid",
-                        "--exclude=node_modules/",
-                        "--exclude=__pycache__/",
-                        "--exclude=.DS_Store",
-                        src + "/", dest + "/"
-                    ]
-                    subprocess.run(cmd, check=True)
-                
-                print(f"✅ {item} sincronizado")
-            except Exception as e:
-                print(f"❌ Erro ao sincronizar {item}: {e}")
+    # Os itens são árvores independentes; cada rsync roda em paralelo
+    with ThreadPoolExecutor(max_workers=INITIAL_SYNC_WORKERS) as executor:
+        list(executor.map(sync_item, SYNC_ITEMS))
     
     # Criar arquivo de timestamp
     with open(os.path.join(DEST_DIR, "last_sync.txt"), "w") as f:
@@ -148,21 +244,31 @@ def main():
     # Configurar observador
     event_handler = SyncHandler()
     observer = Observer()
-    observer.schedule(event_handler, SOURCE_DIR, recursive=True)
     
-    # Iniciar monitoramento
-    observer.start()
-    print("\n👀 Monitorando mudanças...")
-    print("   Pressione Ctrl+C para parar")
+    # Bloqueia até Ctrl+C ou SIGTERM, sem acordar a cada segundo
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
     
     try:
-        while True:
-            time.sleep(1)
+        observer.schedule(event_handler, SOURCE_DIR, recursive=True)
+        
+        # Iniciar monitoramento
+        observer.start()
+        print("\n👀 Monitorando mudanças...")
+        print("   Pressione Ctrl+C para parar")
+        
+        stop_event.wait()
     except KeyboardInterrupt:
-        observer.stop()
-        print("\n🛑 Sincronização parada")
+        pass
+    finally:
+        # O worker de debounce não é daemon: sempre é parado aqui, depois
+        # de terminar a cópia em andamento
+        if observer.is_alive():
+            observer.stop()
+            observer.join()
+        event_handler.flush_pending()
     
-    observer.join()
+    print("\n🛑 Sincronização parada")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -2,48 +2,224 @@
 """
 MCP RAG Server - Versão mínima funcional
 """
+import functools
+import hashlib
 import json
+import re
 import sys
 import os
+import unicodedata
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# Codec JSON escolhido uma vez, na importação: orjson, ujson ou a stdlib.
+# dumps sempre devolve bytes UTF-8 sem escapar acentos.
+if orjson:
+    dumps = orjson.dumps
+    loads = orjson.loads
+elif ujson:
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+    
+    loads = ujson.loads
+else:
+    def dumps(obj):
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+    
+    loads = json.loads
+
 # Cache path
 CACHE_PATH = Path.home() / ".claude" / "mcp-rag-cache"
 CACHE_FILE = CACHE_PATH / "documents.json"
 
+# Layout do documents.json: um documento por linha entre FILE_HEAD e
+# FILE_TAIL, para que um novo documento seja anexado sem reescrever os demais
+FILE_HEAD = b'{"documents":[\n'
+FILE_TAIL = b'\n]}\n'
+
+# Quantas consultas recentes (query, limit) têm o resultado guardado
+SEARCH_CACHE_SIZE = 256
+
+# Tokens do índice invertido usado como pré-filtro da busca
+TOKEN_RE = re.compile(r'\w+')
+
+def fold(text):
+    """Forma usada na comparação: NFC + casefold (ex.: "ß" casa com "ss")"""
+    return unicodedata.normalize('NFC', text).casefold()
+
+def search_text(doc):
+    """Texto em que a busca procura: título + conteúdo, normalizado"""
+    return fold(f"{doc.get('title', '')} {doc.get('content', '')}")
+
+def content_key(doc):
+    """Digest do conteúdo, usado para recusar documentos repetidos"""
+    content = doc.get('content', '')
+    return hashlib.blake2b(content.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
 class RAGServer:
     def __init__(self):
         self.documents = []
-        self.load_documents()
+        self.search_texts = []
+        self.index = {}
+        self.id_to_pos = {}
+        self.content_to_pos = {}
+        self.removed = 0
+        # O cache só é lido na primeira operação que precisa dele, para não
+        # atrasar o handshake (initialize/tools/list) do cliente MCP
+        self.loaded = False
+        # Resultados de consultas repetidas; invalidado a cada mudança
+        self.cached_search = functools.lru_cache(maxsize=SEARCH_CACHE_SIZE)(self.run_search)
+    
+    def ensure_loaded(self):
+        """Carrega o cache se ainda não foi carregado"""
+        if not self.loaded:
+            self.load_documents()
     
     def load_documents(self):
         """Carrega documentos do cache"""
+        documents = []
         if CACHE_FILE.exists():
+            # Cache ilegível é erro, não cache vazio: seguir com [] faria a
+            # próxima gravação apagar do disco todos os documentos
             try:
-                with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.documents = data.get('documents', [])
-            except:
-                self.documents = []
+                documents = loads(CACHE_FILE.read_bytes())['documents']
+            except (ValueError, TypeError, KeyError) as e:
+                raise ValueError(f'Invalid cache file {CACHE_FILE}: {e!r}') from e
+        self.documents = documents
+        self.loaded = True
+        self.build_index()
+    
+    def build_index(self):
+        """Reconstrói o índice invertido token -> posições em self.documents"""
+        self.index = {}
+        self.search_texts = []
+        self.id_to_pos = {}
+        self.content_to_pos = {}
+        self.removed = 0
+        self.cached_search.cache_clear()
+        for doc in self.documents:
+            self.index_document(doc)
+    
+    def compact(self):
+        """Descarta as lápides de documentos removidos e reindexa"""
+        self.documents = [doc for doc in self.documents if doc is not None]
+        self.build_index()
+    
+    def index_document(self, doc):
+        """Registra o próximo documento no índice e no cache de texto normalizado"""
+        i = len(self.search_texts)
+        text = search_text(doc)
+        # Guardado em UTF-8: a busca de substring roda sobre bytes (memchr/
+        # two-way em C) e o resultado é o mesmo da busca sobre str
+        self.search_texts.append(text.encode('utf-8', 'surrogatepass'))
+        for token in set(TOKEN_RE.findall(text)):
+            self.index.setdefault(token, set()).add(i)
+        # Conjunto de posições também para ids: o backend TypeScript gera
+        # doc_<timestamp> no mesmo arquivo e pode repetir um id
+        if doc.get('id') is not None:
+            self.id_to_pos.setdefault(doc['id'], set()).add(i)
+        # Conjunto de posições: um cache antigo pode ter cópias repetidas
+        self.content_to_pos.setdefault(content_key(doc), set()).add(i)
+    
+    def candidates(self, query_folded):
+        """Posições dos documentos que podem conter a consulta (ou None)
+        
+        Todo documento que contém a consulta como substring contém os tokens
+        internos dela inteiros, então basta cruzar as postings exatas desses
+        tokens. O primeiro e o último token podem ser só sufixo/prefixo de uma
+        palavra do documento; sem token interno devolve None e a busca faz a
+        varredura direta, que para no limit. O resultado é um superconjunto
+        que ainda precisa ser confirmado com a comparação de substring.
+        """
+        end = len(query_folded)
+        interior = {match.group() for match in TOKEN_RE.finditer(query_folded)
+                    if match.start() > 0 and match.end() < end}
+        if not interior:
+            return None
+        
+        return set.intersection(*(self.index.get(token, set()) for token in interior))
     
     def save_documents(self):
         """Salva documentos no cache"""
         CACHE_PATH.mkdir(parents=True, exist_ok=True)
-        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump({'documents': self.documents}, f, ensure_ascii=False, indent=2)
+        body = b',\n'.join(dumps(doc) for doc in self.documents if doc is not None)
+        # Grava em um temporário e troca com os.replace: quem lê o cache
+        # (inclusive o backend) nunca vê um arquivo pela metade
+        tmp_file = CACHE_FILE.with_suffix('.json.tmp')
+        tmp_file.write_bytes(FILE_HEAD + body + FILE_TAIL)
+        os.replace(tmp_file, CACHE_FILE)
+    
+    def append_document(self, doc):
+        """Anexa um documento ao final do cache"""
+        # Só anexa se o arquivo em disco estiver no layout de uma linha por
+        # documento e terminar num documento: outro processo (cada sessão
+        # sobe o seu rag_server) pode tê-lo reescrito ou esvaziado
+        try:
+            with open(CACHE_FILE, 'r+b') as f:
+                head = f.read(len(FILE_HEAD))
+                size = f.seek(0, os.SEEK_END)
+                if head == FILE_HEAD and size > len(FILE_HEAD) + len(FILE_TAIL):
+                    f.seek(-(len(FILE_TAIL) + 1), os.SEEK_END)
+                    if f.read() == b'}' + FILE_TAIL:
+                        f.seek(-len(FILE_TAIL), os.SEEK_END)
+                        f.write(b',\n' + dumps(doc) + FILE_TAIL)
+                        return
+        except OSError:
+            pass
+        
+        self.save_documents()
     
     def search(self, query, limit=5):
         """Busca simples por texto"""
-        query_lower = query.lower()
+        self.ensure_loaded()
+        return self.cached_search(query, limit)
+    
+    def search_batch(self, queries, limit=5):
+        """Várias buscas numa chamada, agrupadas por consulta"""
+        self.ensure_loaded()
+        grouped = []
+        for query in queries:
+            results = self.cached_search(query, limit)
+            grouped.append({
+                'query': query,
+                'results': results,
+                'total': len(results)
+            })
+        return grouped
+    
+    def run_search(self, query, limit):
+        """Executa a busca sem passar pelo cache de resultados"""
+        query_folded = fold(query)
+        query_bytes = query_folded.encode('utf-8', 'surrogatepass')
         results = []
         
-        for doc in self.documents:
-            content = f"{doc.get('title', '')} {doc.get('content', '')}".lower()
-            if query_lower in content:
+        # Consultas sem token interno varrem tudo, em ordem, até o limit
+        positions = self.candidates(query_folded)
+        if positions is None:
+            positions = range(len(self.documents))
+        else:
+            positions = sorted(positions)
+        
+        for i in positions:
+            text = self.search_texts[i]
+            if text is not None and query_bytes in text:
+                doc = self.documents[i]
+                content = doc.get('content', '')
+                if len(content) > 200:
+                    content = content[:200] + '...'
                 results.append({
                     'id': doc.get('id'),
                     'title': doc.get('title'),
-                    'content': doc.get('content', '')[:200] + '...' if len(doc.get('content', '')) > 200 else doc.get('content', ''),
+                    'content': content,
                     'type': doc.get('type'),
                     'source': doc.get('source')
                 })
@@ -55,193 +231,267 @@ class RAGServer:
     
     def add_document(self, doc):
         """Adiciona documento"""
+        self.ensure_loaded()
+        # Conteúdo já presente: devolve o documento existente em vez de
+        # duplicá-lo no cache e em todas as buscas seguintes
+        positions = self.content_to_pos.get(content_key(doc))
+        if positions:
+            return self.documents[min(positions)]
+        
         if 'id' not in doc:
             import time
-            doc['id'] = f"doc_{int(time.time() * 1000)}"
+            stamp = int(time.time() * 1000)
+            # Duas adições no mesmo milissegundo não podem dividir o id
+            while f"doc_{stamp}" in self.id_to_pos:
+                stamp += 1
+            doc['id'] = f"doc_{stamp}"
         
         self.documents.append(doc)
-        self.save_documents()
+        self.index_document(doc)
+        self.cached_search.cache_clear()
+        self.append_document(doc)
         return doc
     
     def remove_document(self, doc_id):
         """Remove documento"""
-        for i, doc in enumerate(self.documents):
-            if doc.get('id') == doc_id:
-                self.documents.pop(i)
-                self.save_documents()
-                return True
-        return False
+        self.ensure_loaded()
+        positions = self.id_to_pos.get(doc_id)
+        if not positions:
+            return False
+        
+        # Com ids repetidos, remove uma cópia por chamada: a primeira
+        i = min(positions)
+        positions.discard(i)
+        if not positions:
+            del self.id_to_pos[doc_id]
+        
+        # Deixa uma lápide no lugar: as posições dos demais documentos no
+        # índice continuam válidas e nada é deslocado na lista
+        key = content_key(self.documents[i])
+        positions = self.content_to_pos[key]
+        positions.discard(i)
+        if not positions:
+            del self.content_to_pos[key]
+        for token in set(TOKEN_RE.findall(search_text(self.documents[i]))):
+            postings = self.index[token]
+            postings.discard(i)
+            if not postings:
+                del self.index[token]
+        self.documents[i] = None
+        self.search_texts[i] = None
+        self.removed += 1
+        self.cached_search.cache_clear()
+        
+        if self.removed * 4 > len(self.documents):
+            self.compact()
+        
+        self.save_documents()
+        return True
     
     def list_documents(self):
         """Lista todos os documentos"""
+        self.ensure_loaded()
         return [{
             'id': doc.get('id'),
             'title': doc.get('title'),
             'type': doc.get('type'),
             'source': doc.get('source')
-        } for doc in self.documents]
+        } for doc in self.documents if doc is not None]
     
     def get_stats(self):
         """Estatísticas do cache"""
+        self.ensure_loaded()
         return {
-            'total_documents': len(self.documents),
+            'total_documents': len(self.documents) - self.removed,
             'cache_file': str(CACHE_FILE),
             'cache_size_bytes': CACHE_FILE.stat().st_size if CACHE_FILE.exists() else 0
         }
 
+# Respostas estáticas, montadas uma única vez
+INITIALIZE_RESULT = {
+    'protocolVersion': '2024-11-05',
+    'capabilities': {
+        'tools': {}
+    },
+    'serverInfo': {
+        'name': 'rag-server',
+        'version': '1.0.0'
+    }
+}
+
+TOOLS = [
+    {
+        'name': 'search',
+        'description': 'Busca documentos no cache RAG',
+        'inputSchema': {
+            'type': 'object',
+            'properties': {
+                'query': {'type': 'string'},
+                'limit': {'type': 'number', 'default': 5}
+            },
+            'required': ['query']
+        }
+    },
+    {
+        'name': 'search_batch',
+        'description': 'Busca várias consultas no cache RAG de uma vez',
+        'inputSchema': {
+            'type': 'object',
+            'properties': {
+                'queries': {'type': 'array', 'items': {'type': 'string'}},
+                'limit': {'type': 'number', 'default': 5}
+            },
+            'required': ['queries']
+        }
+    },
+    {
+        'name': 'add',
+        'description': 'Adiciona documento ao cache RAG',
+        'inputSchema': {
+            'type': 'object',
+            'properties': {
+                'title': {'type': 'string'},
+                'content': {'type': 'string'},
+                'type': {'type': 'string'},
+                'source': {'type': 'string'}
+            },
+            'required': ['title', 'content']
+        }
+    },
+    {
+        'name': 'remove',
+        'description': 'Remove documento do cache RAG',
+        'inputSchema': {
+            'type': 'object',
+            'properties': {
+                'id': {'type': 'string'}
+            },
+            'required': ['id']
+        }
+    },
+    {
+        'name': 'list',
+        'description': 'Lista todos os documentos',
+        'inputSchema': {
+            'type': 'object',
+            'properties': {}
+        }
+    },
+    {
+        'name': 'stats',
+        'description': 'Estatísticas do cache RAG',
+        'inputSchema': {
+            'type': 'object',
+            'properties': {}
+        }
+    }
+]
+
+# Resultados que nunca mudam, serializados uma vez: o main só encaixa o id
+STATIC_RESULTS = {
+    'initialize': dumps(INITIALIZE_RESULT),
+    'tools/list': dumps({'tools': TOOLS})
+}
+
 # Instância global
 server = RAGServer()
 
+def text_result(payload):
+    """Envelopa o payload como conteúdo de texto da resposta MCP"""
+    return {
+        'content': [{
+            'type': 'text',
+            'text': dumps(payload).decode()
+        }]
+    }
+
+def tool_search(args):
+    results = server.search(args['query'], args.get('limit', 5))
+    return text_result({
+        'results': results,
+        'query': args['query'],
+        'total': len(results)
+    })
+
+def tool_search_batch(args):
+    queries = args['queries']
+    # Uma string também é iterável: sem isto "abc" viraria três buscas
+    if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+        raise ValueError('queries must be a list of strings')
+    batch = server.search_batch(queries, args.get('limit', 5))
+    return text_result({
+        'batch': batch,
+        'total': len(batch)
+    })
+
+def tool_add(args):
+    new_doc = {
+        'title': args['title'],
+        'content': args['content'],
+        'type': args.get('type', 'general'),
+        'source': args.get('source', 'manual')
+    }
+    doc = server.add_document(new_doc)
+    # Duplicado não é adicionado: o documento devolvido é o que já existia,
+    # com os metadados dele, e não os enviados nesta chamada
+    duplicate = doc is not new_doc
+    return text_result({
+        'success': not duplicate,
+        'document': doc,
+        'duplicate': duplicate
+    })
+
+def tool_remove(args):
+    success = server.remove_document(args['id'])
+    return text_result({
+        'success': success,
+        'id': args['id']
+    })
+
+def tool_list(args):
+    docs = server.list_documents()
+    return text_result({
+        'documents': docs,
+        'total': len(docs)
+    })
+
+def tool_stats(args):
+    return text_result(server.get_stats())
+
+# Nome da ferramenta -> função que a executa (um lookup por chamada)
+TOOL_HANDLERS = {
+    'search': tool_search,
+    'search_batch': tool_search_batch,
+    'add': tool_add,
+    'remove': tool_remove,
+    'list': tool_list,
+    'stats': tool_stats
+}
+
 def handle_request(request):
     """Processa requisições MCP"""
     method = request.get('method')
     params = request.get('params', {})
     
     if method == 'initialize':
-        return {
-            'protocolVersion': '2024-11-05',
-            'capabilities': {
-                'tools': {}
-            },
-            'serverInfo': {
-                'name': 'rag-server',
-                'version': '1.0.0'
-            }
-        }
+        return INITIALIZE_RESULT
     
     elif method == 'initialized':
         return None  # Notificação, sem resposta
     
     elif method == 'tools/list':
-        return {
-            'tools': [
-                {
-                    'name': 'search',
-                    'description': 'Busca documentos no cache RAG',
-                    'inputSchema': {
-                        'type': 'object',
-                        'properties': {
-                            'query': {'type': 'string'},
-                            'limit': {'type': 'number', 'default': 5}
-                        },
-                        'required': ['query']
-                    }
-                },
-                {
-                    'name': 'add',
-                    'description': 'Adiciona documento ao cache RAG',
-                    'inputSchema': {
-                        'type': 'object',
-                        'properties': {
-                            'title': {'type': 'string'},
-                            'content': {'type': 'string'},
-                            'type': {'type': 'string'},
-                            'source': {'type': 'string'}
-                        },
-                        'required': ['title', 'content']
-                    }
-                },
-                {
-                    'name': 'remove',
-                    'description': 'Remove documento do cache RAG',
-                    'inputSchema': {
-                        'type': 'object',
-                        'properties': {
-                            'id': {'type': 'string'}
-                        },
-                        'required': ['id']
-                    }
-                },
-                {
-                    'name': 'list',
-                    'description': 'Lista todos os documentos',
-                    'inputSchema': {
-                        'type': 'object',
-                        'properties': {}
-                    }
-                },
-                {
-                    'name': 'stats',
-                    'description': 'Estatísticas do cache RAG',
-                    'inputSchema': {
-                        'type': 'object',
-                        'properties': {}
-                    }
-                }
-            ]
-        }
+        return {'tools': TOOLS}
     
     elif method == 'tools/call':
         tool_name = params.get('name')
         args = params.get('arguments', {})
         
-        try:
-            if tool_name == 'search':
-                results = server.search(args['query'], args.get('limit', 5))
-                return {
-                    'content': [{
-                        'type': 'text',
-                        'text': json.dumps({
-                            'results': results,
-                            'query': args['query'],
-                            'total': len(results)
-                        }, ensure_ascii=False)
-                    }]
-                }
-            
-            elif tool_name == 'add':
-                doc = server.add_document({
-                    'title': args['title'],
-                    'content': args['content'],
-                    'type': args.get('type', 'general'),
-                    'source': args.get('source', 'manual')
-                })
-                return {
-                    'content': [{
-                        'type': 'text',
-                        'text': json.dumps({
-                            'success': True,
-                            'document': doc
-                        }, ensure_ascii=False)
-                    }]
-                }
-            
-            elif tool_name == 'remove':
-                success = server.remove_document(args['id'])
-                return {
-                    'content': [{
-                        'type': 'text',
-                        'text': json.dumps({
-                            'success': success,
-                            'id': args['id']
-                        }, ensure_ascii=False)
-                    }]
-                }
-            
-            elif tool_name == 'list':
-                docs = server.list_documents()
-                return {
-                    'content': [{
-                        'type': 'text',
-                        'text': json.dumps({
-                            'documents': docs,
-                            'total': len(docs)
-                        }, ensure_ascii=False)
-                    }]
-                }
-            
-            elif tool_name == 'stats':
-                stats = server.get_stats()
-                return {
-                    'content': [{
-                        'type': 'text',
-                        'text': json.dumps(stats, ensure_ascii=False)
-                    }]
-                }
-            
-            else:
-                return {'error': {'message': f'Tool not found: {tool_name}'}}
+        handler = TOOL_HANDLERS.get(tool_name) if isinstance(tool_name, str) else None
+        if handler is None:
+            return {'error': {'message': f'Tool not found: {tool_name}'}}
         
+        try:
+            return handler(args)
         except Exception as e:
             return {'error': {'message': str(e)}}
     
@@ -250,13 +500,22 @@ def handle_request(request):
 
 def main():
     """Loop principal do servidor MCP"""
-    while True:
+    # stdio em modo binário: loads aceita bytes e a resposta é gravada
+    # direto no buffer, sem passar pelas camadas de texto do print
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    
+    for line in iter(stdin.readline, b''):
+        request = None
         try:
-            line = sys.stdin.readline()
-            if not line:
-                break
+            request = loads(line)
+            method = request.get('method') if isinstance(request, dict) else None
+            if isinstance(method, str) and method in STATIC_RESULTS:
+                stdout.write(b'{"jsonrpc":"2.0","id":' + dumps(request.get('id')) +
+                             b',"result":' + STATIC_RESULTS[method] + b'}\n')
+                stdout.flush()
+                continue
             
-            request = json.loads(line.strip())
             result = handle_request(request)
             
             if result is None:
@@ -268,20 +527,18 @@ def main():
                 'result': result
             }
             
-            print(json.dumps(response))
-            sys.stdout.flush()
-            
         except Exception as e:
-            error_response = {
+            response = {
                 'jsonrpc': '2.0',
-                'id': request.get('id') if 'request' in locals() else None,
+                'id': request.get('id') if isinstance(request, dict) else None,
                 'error': {
                     'code': -32603,
                     'message': str(e)
                 }
             }
-            print(json.dumps(error_response))
-            sys.stdout.flush()
+        
+        stdout.write(dumps(response) + b'\n')
+        stdout.flush()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file